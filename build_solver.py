@@ -0,0 +1,32 @@
+"""Build the wall-follower as an ahead-of-time compiled extension module.
+
+Run `python build_solver.py` once to produce the `maze_solver` extension
+next to this file. main.py uses it when it is importable and was built
+from the current _solve, so short runs do not pay for JIT compilation;
+otherwise it falls back to the JIT.
+"""
+import os
+
+from numba.pycc import CC
+
+from main import _solve, _solver_fingerprint
+
+cc = CC('maze_solver')
+cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+
+FINGERPRINT = _solver_fingerprint()
+
+
+@cc.export('fingerprint', 'i8()')
+def fingerprint():
+    return FINGERPRINT
+
+
+@cc.export('solve', 'UniTuple(i8, 4)(u1[::1], i8, u1[::1], i4[:, ::1],'
+                    ' i8, i8, i8)')
+def solve(floor, width, visited, trace, start, od, goal):
+    return _solve(floor, width, visited, trace, start, od, goal)
+
+
+if __name__ == "__main__":
+    cc.compile()
@@ -1,35 +1,31 @@
 from __future__ import annotations  # for static constructor
+import hashlib
+import inspect
 import os
 import sys
-from enum import Enum
-from typing import NamedTuple
+import warnings
+from collections import deque
+from typing import Final, NamedTuple
 
+import numpy as np
+from numba import njit, prange
 
-class EFloor(Enum):
-    Normal = 0
-    Wall = 1
-    Start = 2
-    Goal = 3
 
-    def to_char(self) -> chr:
-        if (self == EFloor.Normal): return ' '
-        elif (self == EFloor.Wall): return '*'
-        elif (self == EFloor.Start): return 'o'
-        elif (self == EFloor.Goal): return 'x'
-        raise ValueError(f"Cannot convert to_char() with self={self}")
+# floor codes
+NORMAL: Final[int] = 0
+WALL: Final[int] = 1
+START: Final[int] = 2
+GOAL: Final[int] = 3
 
-    @staticmethod
-    def of(c: chr) -> EFloor:
-        if c == ' ': return EFloor.Normal
-        elif c == '*': return EFloor.Wall
-        elif c == 'o': return EFloor.Start
-        elif c == 'x': return EFloor.Goal
-        raise ValueError(f"Invalid character: '{c}'")
+# printable character of each floor code
+FLOOR_CHARS: Final[str] = " *ox"
 
+# translation table from floor codes to their printable characters
+_TO_CHAR = bytes(ord(FLOOR_CHARS[i]) if i < len(FLOOR_CHARS) else i
+                 for i in range(256))
 
-class Vector2D(NamedTuple):
-    x: int
-    y: int
+# translation table from characters to floor codes, 0xFF for invalid ones
+_TO_CODE = bytes(FLOOR_CHARS.find(chr(i)) & 0xFF for i in range(256))
 
 
 class Point2D(NamedTuple):
@@ -39,200 +35,405 @@ class Point2D(NamedTuple):
     def __str__(self) -> str:
         return f"({self.x}, {self.y})"
 
-    def __add__(self, other: Vector2D):
-        if (type(other) is not Vector2D):
-            raise TypeError("other must be Vector2D type.")
-        return self.__class__(self.x + other.x, self.y + other.y)
-
 
 class Maze:
-    def __init__(self, floor_map_2d: list, start: Point2D,
+    __slots__ = ("floor", "start", "goal")
+
+    def __init__(self, floor_map_2d: np.ndarray, start: Point2D,
                  goal: Point2D) -> None:
+        # floor_map_2d is surrounded by a one-cell wall border and
+        # start/goal are positions in that padded grid; use from_grid to
+        # build a maze from a grid without the border
+        if (floor_map_2d.ndim != 2 or min(floor_map_2d.shape) < 2
+                or (floor_map_2d[[0, -1], :] != WALL).any()
+                or (floor_map_2d[:, [0, -1]] != WALL).any()):
+            raise ValueError("floor_map_2d must be surrounded by a wall"
+                             " border; use Maze.from_grid() to add it.")
         self.floor = floor_map_2d
         self.start = start
         self.goal = goal
 
+    @staticmethod
+    def from_grid(floor_map_2d: np.ndarray, start: Point2D,
+                  goal: Point2D) -> Maze:
+        """Build a maze from a grid of floor codes without the wall border.
+
+        `start` and `goal` are positions in `floor_map_2d`.
+        """
+        # the border keeps the player inside the grid even if the maze
+        # itself is not closed, so the solver needs no bounds checks
+        floors = np.pad(np.asarray(floor_map_2d, dtype=np.uint8), 1,
+                        constant_values=WALL)
+        return Maze(floors, Point2D(start[0] + 1, start[1] + 1),
+                    Point2D(goal[0] + 1, goal[1] + 1))
+
     def to_string(self) -> str:
-        chars_2d = [[floor.to_char() for floor in row] for row in self.floor]
-        lines = ["".join(row) for row in chars_2d]
+        floor = self.floor[1:-1, 1:-1]
+        height, width = floor.shape
+        chars = floor.tobytes().translate(_TO_CHAR).decode()
+        lines = [chars[i * width:(i + 1) * width] for i in range(height)]
         result = os.linesep.join(lines)
         return result
 
     @staticmethod
     def parse(s: str) -> Maze:
-        Maze._validate(s)
-
         lines = s.splitlines()
-        floors = [[EFloor.of(aChar) for aChar in line] for line in lines]
+        codes = "".join(lines).encode().translate(_TO_CODE)
+        if (0xFF in codes):
+            invalid = next(c for c in "".join(lines) if c not in FLOOR_CHARS)
+            raise ValueError(f"Invalid character: '{invalid}'")
 
-        start_at = Maze._find_xy(EFloor.Start, floors)
-        goal_at = Maze._find_xy(EFloor.Goal, floors)
-        return Maze(floors, start_at, goal_at)
+        Maze._validate(codes)
+
+        width = len(lines[0]) if lines else 0
+        for i, line in enumerate(lines):
+            if (len(line) != width):
+                raise ValueError(f"Line {i + 1} has {len(line)} characters"
+                                 f" instead of {width}: '{line}'")
+
+        floors = np.frombuffer(codes, dtype=np.uint8).reshape(len(lines), -1)
+        start_at, goal_at = Maze._find_start_and_goal(floors)
+        return Maze.from_grid(floors, start_at, goal_at)
 
     @staticmethod
-    def _validate(s: str) -> None:
-        has_start = EFloor.Start.to_char() in s
-        if (not has_start):
+    def _validate(codes: bytes) -> None:
+        if (START not in codes):
             print("Error: Cannot find the beginning position. Abort program.")
             sys.exit(1)
 
-        has_goal = EFloor.Goal.to_char() in s
-        if (not has_goal):
+        if (GOAL not in codes):
             print("Error: Cannot find the exit position. Abort program.")
             sys.exit(1)
 
     @staticmethod
-    def _find_xy(kind: EFloor, floor_map_2d: list) -> Point2D:
-        x = [i for i, row in enumerate(floor_map_2d) if (kind in row)][0]
-        y = floor_map_2d[x].index(kind)
-        return Point2D(x, y)
-
-
-class EOrientation(Enum):
-    North = Vector2D(-1, 0)
-    West = Vector2D(0, -1)
-    South = Vector2D(+1, 0)
-    East = Vector2D(0, +1)
-
-    def turn_to_the_right(self) -> EOrientation:
-        if self == EOrientation.North: return EOrientation.East
-        if self == EOrientation.West: return EOrientation.North
-        if self == EOrientation.South: return EOrientation.West
-        if self == EOrientation.East: return EOrientation.South
-        raise ValueError(f"{self} is not a valid {EOrientation.__name__}")
-
-    def turn_to_the_left(self) -> EOrientation:
-        if self == EOrientation.North: return EOrientation.West
-        if self == EOrientation.West: return EOrientation.South
-        if self == EOrientation.South: return EOrientation.East
-        if self == EOrientation.East: return EOrientation.North
-        raise ValueError(f"{self} is not a valid {EOrientation.__name__}")
-
-    def turn_around(self) -> EOrientation:
-        if self == EOrientation.North: return EOrientation.South
-        if self == EOrientation.West: return EOrientation.East
-        if self == EOrientation.South: return EOrientation.North
-        if self == EOrientation.East: return EOrientation.West
-        raise ValueError(f"{self} is not a valid {EOrientation.__name__}")
+    def _find_start_and_goal(floor_map_2d: np.ndarray) -> tuple:
+        # one scan picks up every start and goal cell at once; _validate
+        # has already made sure both exist
+        marks = np.argwhere(floor_map_2d >= START)
+        kinds = floor_map_2d[marks[:, 0], marks[:, 1]]
+        starts = marks[kinds == START]
+        goals = marks[kinds == GOAL]
+        return (Point2D(int(starts[0][0]), int(starts[0][1])),
+                Point2D(int(goals[0][0]), int(goals[0][1])))
 
-    def __str__(self) -> str:
-        return f"{self.name.lower()}"
+    @staticmethod
+    def unpadded(x: int, y: int) -> Point2D:
+        """Convert a grid position back to the coordinates of the input."""
+        return Point2D(x - 1, y - 1)
+
+
+# orientations, in clockwise order
+NORTH: Final[int] = 0
+EAST: Final[int] = 1
+SOUTH: Final[int] = 2
+WEST: Final[int] = 3
+
+ORIENTATION_NAMES: Final[tuple] = ("north", "east", "south", "west")
+
+# (x, y) step of each orientation
+DIR_DX: Final[tuple] = (-1, 0, +1, 0)
+DIR_DY: Final[tuple] = (0, +1, 0, -1)
+
+
+def turn_to_the_right(d: int) -> int:
+    return (d + 1) & 3
 
 
-class Pose(NamedTuple):
-    position: Point2D
-    orientation: Vector2D
+def turn_to_the_left(d: int) -> int:
+    return (d - 1) & 3
+
+
+def turn_around(d: int) -> int:
+    return d ^ 2
+
+
+# orientations a wall-follower tries in turn for each orientation:
+# right, forward, left and, as the last resort, backward
+TURN_FOR: Final[np.ndarray] = np.array(
+    [[turn_to_the_right(d), d, turn_to_the_left(d), turn_around(d)]
+     for d in range(4)], dtype=np.int64)
 
 
 class Player:
-    def __init__(self, position: Point2D, orientation: EOrientation) -> None:
-        self.position = position
-        self.orientation = orientation
+    __slots__ = ("x", "y", "d")
+
+    def __init__(self, position: Point2D, orientation: int) -> None:
+        self.x, self.y = position
+        self.d = orientation
 
-    def is_located_at(self, pos: Point2D) -> bool:
-        return self.position == pos
+    def is_located_at(self, x: int, y: int) -> bool:
+        return self.x == x and self.y == y
 
     def turn_to_the_right(self) -> None:
-        self.orientation = self.orientation.turn_to_the_right()
+        self.d = turn_to_the_right(self.d)
 
     def keep_orientation(self) -> None:
         # do nothing intentionally
         return
 
     def turn_to_the_left(self) -> None:
-        self.orientation = self.orientation.turn_to_the_left()
+        self.d = turn_to_the_left(self.d)
 
     def turn_around(self) -> None:
-        self.orientation = self.orientation.turn_around()
+        self.d = turn_around(self.d)
 
     def step_forward(self) -> None:
-        self.position = self.position + self.orientation.value
-
-    def to_Pose(self) -> Pose:
-        return Pose(self.position, self.orientation)
+        self.x += DIR_DX[self.d]
+        self.y += DIR_DY[self.d]
+
+
+@njit(cache=True, boundscheck=False)
+def _solve(floor: np.ndarray, width: int, visited: np.ndarray,
+           trace: np.ndarray, start: int, od: int, goal: int) -> tuple:
+    """Walk the maze with the right hand on the wall.
+
+    `floor` is the flattened grid and cells are addressed by the packed
+    index x*W + y. `visited` is a zeroed bitmap of H*W*4 poses, indexed by
+    cell*4 + orientation index. If `trace` has rows (at most H*W*4 are
+    needed), each step is recorded there as (cell, orientation index).
+
+    Returns whether the exit was reached (1) or the player came back to an
+    already visited pose, which means there is no solution (0), followed by
+    the final cell and orientation of the player and the number of steps
+    taken.
+    """
+    # cell offsets of north, east, south and west
+    offsets = (-width, 1, width, -1)
+
+    tracing = trace.shape[0] > 0
+    pos, d = start, od
+    steps = 0
+
+    while pos != goal:
+        pose = pos * 4 + d
+        if visited[pose]:
+            return 0, pos, d, steps
+        visited[pose] = 1
+
+        # k == 3 means going backward. no other choice.
+        k = 0
+        while k < 3 and floor[pos + offsets[TURN_FOR[d, k]]] == WALL:
+            k += 1
+        d = TURN_FOR[d, k]
+
+        if tracing:
+            trace[steps, 0] = pos
+            trace[steps, 1] = d
+        steps += 1
+
+        pos += offsets[d]
+
+    return 1, pos, d, steps
+
+
+def _solver_fingerprint() -> int:
+    """Hash the source of _solve and the constants compiled into it."""
+    source = (inspect.getsource(_solve.py_func)
+              + repr((WALL, TURN_FOR.tolist())))
+    return int(hashlib.sha256(source.encode()).hexdigest()[:15], 16)
+
+
+def _load_solve():
+    """Return the ahead-of-time compiled _solve built by build_solver.py,
+    or the JIT-compiled one when that build is missing or out of date.
+    """
+    try:
+        import maze_solver
+    except ModuleNotFoundError as e:
+        if e.name != "maze_solver":
+            raise
+        return _solve
+    except ImportError as e:
+        warnings.warn(f"Cannot load maze_solver ({e}); using the JIT.")
+        return _solve
+
+    if maze_solver.fingerprint() != _solver_fingerprint():
+        warnings.warn("maze_solver was built from another version of _solve;"
+                      " run build_solver.py again. Using the JIT.")
+        return _solve
+    return maze_solver.solve
+
+
+solve = _load_solve()
+
+
+@njit(cache=True, parallel=True)
+def _solve_batch(floors: np.ndarray, width: int, starts: np.ndarray,
+                 orientations: np.ndarray, goals: np.ndarray,
+                 out: np.ndarray) -> None:
+    """Run `_solve` on every row of `floors`, a stack of flattened grids
+    of the same width, and store each exit cell (or -1) into `out`.
+    """
+    no_trace = np.empty((0, 2), dtype=np.int32)
+    for i in prange(floors.shape[0]):
+        visited = np.zeros(floors.shape[1] * 4, dtype=np.uint8)
+        found, pos, _, _ = _solve(floors[i], width, visited, no_trace,
+                                  starts[i], orientations[i], goals[i])
+        out[i] = pos if found else -1
+
+
+def solve_batch(mazes: list, orientation: int = NORTH) -> list:
+    """Solve independent mazes in parallel with the wall-follower algorithm.
+
+    Every player starts facing `orientation`. Returns the exit position of
+    each maze, in the coordinates of its input, or None if it has no
+    solution.
+    """
+    if not mazes:
+        return []
+
+    height = max(maze.floor.shape[0] for maze in mazes)
+    width = max(maze.floor.shape[1] for maze in mazes)
+
+    # smaller mazes are padded with walls up to the common shape
+    floors = np.full((len(mazes), height, width), WALL, dtype=np.uint8)
+    for i, maze in enumerate(mazes):
+        h, w = maze.floor.shape
+        floors[i, :h, :w] = maze.floor
+
+    starts = np.array([maze.start.x * width + maze.start.y
+                       for maze in mazes], dtype=np.int64)
+    goals = np.array([maze.goal.x * width + maze.goal.y
+                      for maze in mazes], dtype=np.int64)
+    orientations = np.full(len(mazes), orientation, dtype=np.int64)
+    out = np.empty(len(mazes), dtype=np.int64)
+    _solve_batch(floors.reshape(len(mazes), -1), width,
+                 starts, orientations, goals, out)
+
+    return [Maze.unpadded(*divmod(exit_at, width)) if exit_at != -1 else None
+            for exit_at in out.tolist()]
 
 
 class MazeManager:
-    def __init__(self, maze: Maze, player: Player) -> None:
+    __slots__ = ("maze", "player", "verbose", "_visited", "_trace")
+
+    def __init__(self, maze: Maze, player: Player,
+                 verbose: bool = False) -> None:
         self.maze = maze
         self.player = player
+        self.verbose = verbose
+        self._visited = np.zeros(maze.floor.size * 4, dtype=np.uint8)
+        self._trace = []
 
     def process_players_trial(self) -> None:
         """Try to solve a given maze by using wall-follower algorithm.
         """
-        print(f"Current position: {str(self.player.position)}")
-
-        history = set()
-        while (not (self.is_player_located_at_goal())
-               and (self.player.to_Pose() not in history)):
-
-            history.add(self.player.to_Pose())
-
-            if (self.player_can_go_right()):
-                self.player_turn_to_the_right()
-                self.player_step_forward()
-                continue
-
-            elif (self.player_can_go_forward()):
-                self.player_keep_orientation()
-                self.player_step_forward()
-                continue
-
-            elif (self.player_can_go_left()):
-                self.player_turn_to_the_left()
-                self.player_step_forward()
-                continue
-
-            else:
-                # go backward. no other choice.
-                self.player_turn_around()
-                self.player_step_forward()
-                continue
-
-        if self.is_player_located_at_goal():
-            print(f"Exit at {str(self.player.position)}")
+        print("Current position:"
+              f" {str(Maze.unpadded(self.player.x, self.player.y))}")
+
+        self._visited[:] = 0
+        self._trace = []
+        trace = np.empty((self._visited.size if self.verbose else 0, 2),
+                         dtype=np.int32)
+        width = self.maze.floor.shape[1]
+        start_x, start_y = self.player.x, self.player.y
+        goal_x, goal_y = self.maze.goal
+        # the compiled build only accepts a contiguous uint8 grid
+        floor = np.ascontiguousarray(self.maze.floor, dtype=np.uint8)
+        found, pos, d, steps = solve(floor.ravel(), width,
+                                     self._visited, trace,
+                                     start_x * width + start_y,
+                                     self.player.d,
+                                     goal_x * width + goal_y)
+
+        # leave the player in the pose the walk actually ended in
+        self.player.x, self.player.y = divmod(pos, width)
+        self.player.d = d
+
+        if self.verbose:
+            self._trace.extend((*divmod(pos, width), d)
+                               for pos, d in trace[:steps].tolist())
+            self.print_trace()
+
+        if found:
+            print("Exit at"
+                  f" {str(Maze.unpadded(self.player.x, self.player.y))}")
         else:
             print(f"There is no solution for this maze.")
 
+    def solve_bfs(self) -> list:
+        """Find the shortest path to the goal by breadth-first search.
+
+        Returns the positions from the player's position to the goal, in
+        the coordinates of the input, or an empty list if there is none.
+        """
+        flat_floor = self.maze.floor.ravel()
+        width = self.maze.floor.shape[1]
+        start_x, start_y = self.player.x, self.player.y
+        goal_x, goal_y = self.maze.goal
+        start = start_x * width + start_y
+        goal = goal_x * width + goal_y
+
+        visited = np.zeros(flat_floor.size, dtype=bool)
+        parent = np.full(flat_floor.size, -1, dtype=np.int32)
+        offsets = (-width, 1, width, -1)
+
+        visited[start] = True
+        queue = deque([start])
+        while queue:
+            idx = queue.popleft()
+            if idx == goal:
+                break
+            for offset in offsets:
+                nidx = idx + offset
+                if flat_floor[nidx] != WALL and not visited[nidx]:
+                    visited[nidx] = True
+                    parent[nidx] = idx
+                    queue.append(nidx)
+
+        if not visited[goal]:
+            return []
+
+        path = [goal]
+        while path[-1] != start:
+            path.append(int(parent[path[-1]]))
+        return [Maze.unpadded(*divmod(idx, width)) for idx in reversed(path)]
+
     def is_player_located_at_goal(self) -> bool:
-        return self.player.is_located_at(self.maze.goal)
+        return self.player.is_located_at(*self.maze.goal)
 
     def player_can_go_right(self) -> bool:
-        new_orientation = self.player.orientation.turn_to_the_right()
-        next_pos = self.player.position + new_orientation.value
-        return self._player_can_go(next_pos)
+        d_right = (self.player.d + 1) & 3
+        return self.maze.floor[self.player.x + DIR_DX[d_right],
+                               self.player.y + DIR_DY[d_right]] != WALL
 
     def player_turn_to_the_right(self) -> None:
         self.player.turn_to_the_right()
 
-    def _player_can_go(self, pos: Point2D) -> bool:
-        return self.maze.floor[pos.x][pos.y] != EFloor.Wall
-
     def player_can_go_forward(self) -> bool:
-        next_pos = self.player.position + self.player.orientation.value
-        return self._player_can_go(next_pos)
+        d = self.player.d
+        return self.maze.floor[self.player.x + DIR_DX[d],
+                               self.player.y + DIR_DY[d]] != WALL
 
     def player_keep_orientation(self) -> None:
         self.player.keep_orientation()
 
     def player_step_forward(self) -> None:
-        print(f"At {str(self.player.position)}"
-              f" facing {str(self.player.orientation)}")
+        if self.verbose:
+            self._trace.append((self.player.x, self.player.y, self.player.d))
 
         self.player.step_forward()
 
+    def print_trace(self) -> None:
+        """Print the steps recorded so far, all at once."""
+        lines = [f"At {str(Maze.unpadded(x, y))}"
+                 f" facing {ORIENTATION_NAMES[d]}"
+                 for x, y, d in self._trace]
+        if lines:
+            print(os.linesep.join(lines))
+
     def player_can_go_left(self) -> bool:
-        new_orientation = self.player.orientation.turn_to_the_left()
-        next_pos = self.player.position + new_orientation.value
-        return self._player_can_go(next_pos)
+        d_left = (self.player.d - 1) & 3
+        return self.maze.floor[self.player.x + DIR_DX[d_left],
+                               self.player.y + DIR_DY[d_left]] != WALL
 
     def player_turn_to_the_left(self) -> None:
         self.player.turn_to_the_left()
 
     def player_can_go_backward(self) -> bool:
-        new_orientation = self.player.orientation.turn_around()
-        next_pos = self.player.position + new_orientation.value
-        return self._player_can_go(next_pos)
+        d_back = self.player.d ^ 2
+        return self.maze.floor[self.player.x + DIR_DX[d_back],
+                               self.player.y + DIR_DY[d_back]] != WALL
 
     def player_turn_around(self) -> None:
         self.player.turn_around()
@@ -270,5 +471,6 @@ if __name__ == "__main__":
     maze = Maze.parse(maze3)
     print(maze.to_string())
 
-    manager = MazeManager(maze, Player(maze.start, EOrientation.North))
+    manager = MazeManager(maze, Player(maze.start, NORTH),
+                          verbose=True)
     manager.process_players_trial()